@@ -1,13 +1,21 @@
 import os
+import sys
 import logging
-import requests
-from flask import Flask, request, jsonify, send_file
+import asyncio
+import hashlib
+import re
+import httpx
+from quart import Quart, request, jsonify
+from quart.json.provider import JSONProvider
+import uvicorn
 from dotenv import load_dotenv
 import tempfile
-import io
-from pytz import timezone as pytz_timezone
-from datetime import datetime
-import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from zoneinfo import ZoneInfo
+from datetime import datetime, time, timedelta
+import orjson
 
 # Load environment variables
 load_dotenv()
@@ -19,23 +27,370 @@ logging.basicConfig(
 )
 logger = logging.getLogger('vappi')
 
-# Initialize Flask app
-app = Flask(__name__)
+class OrjsonProvider(JSONProvider):
+    """
+    JSON provider that uses orjson for request bodies and jsonify responses
+    
+    Of the stdlib-style options only default and sort_keys map onto orjson;
+    anything else raises TypeError instead of being silently ignored.
+    """
+    
+    def dumps(self, obj, *, default=None, sort_keys=False, **kwargs):
+        if kwargs:
+            raise TypeError(f"Unsupported orjson dumps options: {', '.join(sorted(kwargs))}")
+        option = orjson.OPT_SORT_KEYS if sort_keys else None
+        return orjson.dumps(obj, default=default, option=option).decode()
+    
+    def loads(self, s, **kwargs):
+        if kwargs:
+            raise TypeError(f"Unsupported orjson loads options: {', '.join(sorted(kwargs))}")
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Same argument handling as jsonify(): one positional value, several as a list, or keywords
+        if args and kwargs:
+            raise TypeError("jsonify() behavior undefined when passed both args and kwargs")
+        if len(args) == 1:
+            obj = args[0]
+        else:
+            obj = list(args) if args else kwargs or None
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE),
+            mimetype="application/json"
+        )
+
+# Initialize Quart app
+app = Quart(__name__)
+app.json = OrjsonProvider(app)
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Settings parsed once from the environment at startup"""
+    elevenlabs_api_key: str
+    elevenlabs_voice_id: str
+    ghl_api_key: str
+    ghl_location_id: str
+    ghl_calendar_id: str
+    tts_cache_size: int
+    tts_cache_max_bytes: int
+    tts_cache_max_entry_bytes: int
+    thread_pool_size: int
+    port: int
+    
+    @classmethod
+    def from_env(cls):
+        """
+        Build the config from environment variables
+        
+        Exits the process if any required variable is missing or a numeric
+        setting is not a valid integer, so a misconfigured deploy fails at
+        startup rather than on the first request.
+        """
+        required = ('ELEVENLABS_API_KEY', 'ELEVENLABS_VOICE_ID', 'GHL_API_KEY', 'GHL_LOCATION_ID', 'GHL_CALENDAR_ID')
+        missing = [name for name in required if not os.getenv(name)]
+        if missing:
+            logger.critical("Missing required environment variables: %s", ", ".join(missing))
+            sys.exit(1)
+        
+        invalid = []
+        
+        def int_setting(*names, default, minimum=None):
+            # The first variable that is set wins; later names are fallbacks
+            for name in names:
+                raw = os.getenv(name)
+                if raw:
+                    try:
+                        value = int(raw)
+                    except ValueError:
+                        invalid.append(f"{name}={raw!r}")
+                        return default
+                    if minimum is not None and value < minimum:
+                        invalid.append(f"{name}={raw!r} (must be >= {minimum})")
+                        return default
+                    return value
+            return default
+        
+        config = cls(
+            elevenlabs_api_key=os.environ['ELEVENLABS_API_KEY'],
+            elevenlabs_voice_id=os.environ['ELEVENLABS_VOICE_ID'],
+            ghl_api_key=os.environ['GHL_API_KEY'],
+            ghl_location_id=os.environ['GHL_LOCATION_ID'],
+            ghl_calendar_id=os.environ['GHL_CALENDAR_ID'],
+            tts_cache_size=int_setting('TTS_CACHE_SIZE', default=512, minimum=0),
+            tts_cache_max_bytes=int_setting('TTS_CACHE_MAX_BYTES', default=64 * 1024 * 1024, minimum=0),
+            tts_cache_max_entry_bytes=int_setting('TTS_CACHE_MAX_ENTRY_BYTES', default=1024 * 1024, minimum=0),
+            thread_pool_size=int_setting('THREAD_POOL_SIZE', default=64, minimum=1),
+            port=int_setting('PORT', 'RAILWAY_PORT', default=5000, minimum=1)
+        )
+        if invalid:
+            logger.critical("Invalid integer environment variables: %s", ", ".join(invalid))
+            sys.exit(1)
+        return config
+
+CFG = Config.from_env()
+
+# Fields a /book request must include
+REQUIRED_BOOKING_FIELDS = frozenset({'name', 'phone', 'email', 'selectedSlot'})
+
+# Naive ISO 8601 slot time, e.g. 2023-04-25T14:00 or 2023-04-25T14:00:00
+ISO_SLOT_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(:\d{2})?')
+
+# Appointments are booked in Central Time (America/Chicago)
+CENTRAL = ZoneInfo("America/Chicago")
+
+# ElevenLabs synthesis settings (also part of the TTS cache key)
+ELEVENLABS_MODEL_ID = "eleven_monolingual_v1"
+ELEVENLABS_STABILITY = 0.5
+ELEVENLABS_SIMILARITY_BOOST = 0.5
+ELEVENLABS_VOICE_SETTINGS = {
+    "stability": ELEVENLABS_STABILITY,
+    "similarity_boost": ELEVENLABS_SIMILARITY_BOOST
+}
+
+# Everything in the request body except the text is fixed, so serialize it once
+ELEVENLABS_PAYLOAD_PREFIX = orjson.dumps({
+    "model_id": ELEVENLABS_MODEL_ID,
+    "voice_settings": ELEVENLABS_VOICE_SETTINGS
+})[:-1] + b',"text":'
+
+# ElevenLabs endpoint and headers are fixed for the lifetime of the process
+ELEVENLABS_URL = f"https://api.elevenlabs.io/v1/text-to-speech/{CFG.elevenlabs_voice_id}"
+ELEVENLABS_HEADERS = {
+    "Accept": "audio/mpeg",
+    "Content-Type": "application/json",
+    "xi-api-key": CFG.elevenlabs_api_key
+}
+
+# LRU cache of generated audio; synthesis is deterministic for a given voice, settings and text
+tts_cache = OrderedDict()
+tts_cache_bytes = 0
+
+# Generations currently streaming from ElevenLabs, keyed like tts_cache, so
+# concurrent requests for the same text share one upstream call. Each future
+# resolves to the audio, an UpstreamError, None if the leader's stream was
+# abandoned (dropped connection or caller disconnect), or NOT_SHAREABLE if the
+# clip is too large to buffer for other requests.
+inflight_tts = {}
+NOT_SHAREABLE = object()
+# Overall limit on how long a request waits for other requests' generations
+INFLIGHT_WAIT_TIMEOUT = 60.0
+# A leader's body must start streaming within this long or it is released
+STREAM_START_TIMEOUT = 10.0
+
+# Keeps fire-and-forget cleanup tasks referenced until they finish
+background_tasks = set()
 
-# Environment variables
-ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
-ELEVENLABS_VOICE_ID = os.getenv('ELEVENLABS_VOICE_ID')
-GHL_API_KEY = os.getenv('GHL_API_KEY')
-GHL_LOCATION_ID = os.getenv('GHL_LOCATION_ID')
-GHL_CALENDAR_ID = os.getenv('GHL_CALENDAR_ID')
+def create_http_client(max_connections, max_keepalive_connections):
+    """
+    Build a pooled HTTP/2 client for an upstream API
+    
+    Idle connections are kept alive for a minute so calls made during the same
+    conversation reuse the existing TLS connection instead of reconnecting.
+    Connects fail fast so a dead upstream cannot pin requests, and failed
+    connection attempts are retried by the transport (nothing has been sent yet).
+    """
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(30.0, connect=3.0),
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            retries=3,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=60.0
+            )
+        )
+    )
+
+# ElevenLabs speaks HTTP/2, so concurrent /voice calls are multiplexed as
+# streams over a few long-lived connections instead of one socket each
+elevenlabs_client = create_http_client(max_connections=10, max_keepalive_connections=10)
+ghl_client = create_http_client(max_connections=100, max_keepalive_connections=50)
+
+# Gateway errors worth retrying on idempotent GoHighLevel lookups
+RETRY_STATUS_CODES = frozenset({502, 503, 504})
+
+@dataclass(frozen=True, slots=True)
+class UpstreamError:
+    """An ElevenLabs failure, shared with coalesced requests so they return the same error"""
+    status_code: int
+    details: str
+
+def upstream_error_response(error):
+    """Build the JSON error response for a failed ElevenLabs generation"""
+    return jsonify({
+        "error": "Failed to generate voice",
+        "details": error.details
+    }), error.status_code
+
+def finish_generation(cache_key, generation, outcome):
+    """Resolve an in-flight generation with its outcome and stop sharing it (idempotent)"""
+    if inflight_tts.get(cache_key) is generation:
+        del inflight_tts[cache_key]
+    if not generation.done():
+        generation.set_result(outcome)
+
+class AudioStream:
+    """
+    Relay a streamed ElevenLabs response to the client, then cache and share the audio
+    
+    Cleanup lives in aclose() rather than in an async generator's finally block.
+    Quart calls aclose() on the body even if it never started iterating it, and
+    on an unstarted generator that would skip the finally, leaking the upstream
+    connection and the in-flight entry.
+    """
+    
+    def __init__(self, response, cache_key, generation):
+        self.response = response
+        self.cache_key = cache_key
+        self.generation = generation
+        self.chunks = []
+        self.buffered_bytes = 0
+        self.chunk_iter = response.aiter_bytes()
+        self.audio = None
+        self.started = False
+        self.closed = False
+        self.watchdog = asyncio.get_running_loop().call_later(STREAM_START_TIMEOUT, self.expire)
+    
+    def __aiter__(self):
+        return self
+    
+    def expire(self):
+        """Release a body Quart never started sending, e.g. because the client went away first"""
+        if self.started or self.closed:
+            return
+        logger.warning("Voice stream was never sent, releasing the upstream response")
+        task = asyncio.ensure_future(self.aclose())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+    
+    async def __anext__(self):
+        if not self.started:
+            self.started = True
+            self.watchdog.cancel()
+        try:
+            chunk = await self.chunk_iter.__anext__()
+        except StopAsyncIteration:
+            logger.info("Voice successfully generated")
+            if self.chunks is not None:
+                self.audio = b"".join(self.chunks)
+                cache_audio(self.cache_key, self.audio)
+            await self.aclose()
+            raise
+        
+        # Buffer only clips small enough to cache; larger ones are relayed without a copy
+        if self.chunks is not None:
+            self.buffered_bytes += len(chunk)
+            if self.buffered_bytes > CFG.tts_cache_max_entry_bytes:
+                logger.info("Voice clip exceeds the cache entry limit, not buffering it")
+                self.chunks = None
+                finish_generation(self.cache_key, self.generation, NOT_SHAREABLE)
+            else:
+                self.chunks.append(chunk)
+        return chunk
+    
+    async def aclose(self):
+        """Release the upstream connection and resolve the in-flight generation (idempotent)"""
+        if self.closed:
+            return
+        self.closed = True
+        self.watchdog.cancel()
+        finish_generation(self.cache_key, self.generation, self.audio)
+        await self.response.aclose()
+
+def audio_response(body):
+    """
+    Wrap MP3 bytes or an async chunk iterator in an attachment response
+    
+    Built directly rather than via send_file, which would compute ETags and
+    conditional-request headers that are pointless for generated audio.
+    """
+    return app.response_class(
+        body,
+        mimetype="audio/mpeg",
+        headers={"Content-Disposition": 'attachment; filename="voice.mp3"'}
+    )
+
+@app.before_serving
+async def configure_thread_pool():
+    """
+    Size the event loop's default executor explicitly
+    
+    Quart runs sync hooks and views there and asyncio resolves DNS there. The
+    stdlib default of min(32, CPUs + 4) is only a handful of threads on small
+    containers, which would throttle new outbound connections under load.
+    """
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=CFG.thread_pool_size, thread_name_prefix='vappi')
+    )
+
+@app.after_serving
+async def close_clients():
+    """Close the upstream HTTP clients on shutdown"""
+    await asyncio.gather(elevenlabs_client.aclose(), ghl_client.aclose())
+
+def tts_cache_key(text):
+    """Build the TTS cache key for the given text and the configured voice settings"""
+    raw = f"{CFG.elevenlabs_voice_id}|{ELEVENLABS_MODEL_ID}|{ELEVENLABS_STABILITY}|{ELEVENLABS_SIMILARITY_BOOST}|{text}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def cache_audio(key, audio):
+    """
+    Store generated audio, evicting least recently used entries beyond the limits
+    
+    The cache is bounded by entry count and by total bytes, since clip size is
+    driven by caller-supplied text. Clips over the per-entry limit are not cached.
+    """
+    global tts_cache_bytes
+    if len(audio) > CFG.tts_cache_max_entry_bytes:
+        return
+    
+    previous = tts_cache.pop(key, None)
+    if previous is not None:
+        tts_cache_bytes -= len(previous)
+    tts_cache[key] = audio
+    tts_cache_bytes += len(audio)
+    
+    while tts_cache and (len(tts_cache) > CFG.tts_cache_size or tts_cache_bytes > CFG.tts_cache_max_bytes):
+        _, evicted = tts_cache.popitem(last=False)
+        tts_cache_bytes -= len(evicted)
+
+def localize_central(naive):
+    """
+    Attach Central Time to a naive datetime, preferring standard time
+    
+    Matches the pytz localize(is_dst=False) behaviour this replaced: the
+    repeated hour on the fall-back day resolves to CST (-06:00) rather than
+    zoneinfo's default of the first, daylight-time occurrence.
+    """
+    candidates = [naive.replace(tzinfo=CENTRAL, fold=fold) for fold in (0, 1)]
+    if candidates[0].utcoffset() != candidates[1].utcoffset():
+        return next(candidate for candidate in candidates if not candidate.dst())
+    return candidates[0]
+
+def parse_ghl_slot(slot):
+    """Parse a GHL free-slot timestamp, accepting a trailing Z and treating naive times as Central"""
+    if slot.endswith('Z'):
+        slot = slot[:-1] + '+00:00'
+    slot_time = datetime.fromisoformat(slot)
+    return slot_time if slot_time.tzinfo is not None else localize_central(slot_time)
+
+async def get_with_retry(url, retries=3, backoff=0.3, **kwargs):
+    """GET with exponential backoff on gateway errors; only used for idempotent lookups"""
+    for attempt in range(retries + 1):
+        response = await ghl_client.get(url, **kwargs)
+        if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+            return response
+        logger.warning("Retrying GET %s after status %s", url, response.status_code)
+        await asyncio.sleep(backoff * 2 ** attempt)
 
 @app.route('/health', methods=['GET'])
-def health_check():
+async def health_check():
     """Simple health check endpoint"""
     return jsonify({"status": "healthy", "service": "VAPPI Voice Bot Backend"})
 
 @app.route('/voice', methods=['POST'])
-def generate_voice():
+async def generate_voice():
     """
     Generate voice audio from text using ElevenLabs API
     
@@ -47,65 +402,96 @@ def generate_voice():
     Returns audio file (MP3)
     """
     try:
-        data = request.get_json()
+        data = await request.get_json()
         
         if not data or 'text' not in data:
             logger.error("Invalid request: missing 'text' field")
             return jsonify({"error": "Missing 'text' field"}), 400
             
         text = data['text']
-        logger.info(f"Voice generation request received: {text[:50]}...")
+        if not isinstance(text, str):
+            logger.error("Invalid request: 'text' is not a string: %r", text)
+            return jsonify({"error": "'text' must be a string"}), 400
+        
+        logger.info("Voice generation request received: %.50s...", text)
         
-        if not ELEVENLABS_API_KEY:
-            logger.error("ELEVENLABS_API_KEY not configured")
-            return jsonify({"error": "ElevenLabs API key not configured"}), 500
+        cache_key = tts_cache_key(text)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + INFLIGHT_WAIT_TIMEOUT
+        retried = False
+        shareable = True
+        while True:
+            cached_audio = tts_cache.get(cache_key)
+            if cached_audio is not None:
+                tts_cache.move_to_end(cache_key)
+                logger.info("Voice served from cache")
+                return audio_response(cached_audio)
+            
+            generation = inflight_tts.get(cache_key)
+            if generation is None:
+                break
             
-        if not ELEVENLABS_VOICE_ID:
-            logger.error("ELEVENLABS_VOICE_ID not configured")
-            return jsonify({"error": "ElevenLabs voice ID not configured"}), 500
+            # Another request is already generating this text; wait for its outcome.
+            # A timed-out waiter leaves the generation alone: the leader may be healthy.
+            logger.info("Waiting for in-flight voice generation of the same text")
+            try:
+                outcome = await asyncio.wait_for(asyncio.shield(generation), deadline - loop.time())
+            except asyncio.TimeoutError:
+                logger.error("Timed out waiting for in-flight voice generation")
+                return jsonify({"error": "Timed out waiting for voice generation"}), 504
+            
+            if isinstance(outcome, bytes):
+                return audio_response(outcome)
+            if outcome is NOT_SHAREABLE:
+                logger.info("In-flight voice clip is too large to share, generating independently")
+                shareable = False
+                break
+            if isinstance(outcome, UpstreamError):
+                logger.error("Shared voice generation failed: %s - %s", outcome.status_code, outcome.details)
+                return upstream_error_response(outcome)
+            
+            # The shared stream was abandoned; retry once, then give up
+            if retried:
+                logger.error("In-flight voice generation was abandoned again")
+                return jsonify({"error": "Voice generation was interrupted"}), 502
+            retried = True
+            logger.warning("In-flight voice generation was abandoned, retrying")
         
         # Call ElevenLabs API
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{ELEVENLABS_VOICE_ID}"
-        headers = {
-            "Accept": "audio/mpeg",
-            "Content-Type": "application/json",
-            "xi-api-key": ELEVENLABS_API_KEY
-        }
-        payload = {
-            "text": text,
-            "model_id": "eleven_monolingual_v1",
-            "voice_settings": {
-                "stability": 0.5,
-                "similarity_boost": 0.5
-            }
-        }
-        
-        response = requests.post(url, json=payload, headers=headers)
+        payload = ELEVENLABS_PAYLOAD_PREFIX + orjson.dumps(text) + b"}"
         
-        if response.status_code == 200:
-            logger.info("Voice successfully generated")
-            # Create a temporary file to store the audio
-            audio_data = io.BytesIO(response.content)
-            audio_data.seek(0)
-            return send_file(
-                audio_data,
-                mimetype="audio/mpeg",
-                as_attachment=True,
-                download_name="voice.mp3"
-            )
+        # Stream the audio through as ElevenLabs produces it rather than buffering the whole MP3
+        upstream_request = elevenlabs_client.build_request(
+            "POST", ELEVENLABS_URL, content=payload, headers=ELEVENLABS_HEADERS
+        )
+        generation = loop.create_future()
+        if shareable:
+            inflight_tts[cache_key] = generation
+        try:
+            response = await elevenlabs_client.send(upstream_request, stream=True)
+            if response.status_code != 200:
+                await response.aread()
+        except httpx.HTTPError as e:
+            error = UpstreamError(502, str(e))
+        except BaseException:
+            finish_generation(cache_key, generation, None)
+            raise
         else:
-            logger.error(f"ElevenLabs API error: {response.status_code} - {response.text}")
-            return jsonify({
-                "error": "Failed to generate voice",
-                "details": response.text
-            }), response.status_code
+            if response.status_code == 200:
+                logger.info("Voice generation started, streaming audio")
+                return audio_response(AudioStream(response, cache_key, generation))
+            error = UpstreamError(response.status_code, response.text)
+        
+        finish_generation(cache_key, generation, error)
+        logger.error("ElevenLabs API error: %s - %s", error.status_code, error.details)
+        return upstream_error_response(error)
             
     except Exception as e:
-        logger.error(f"Voice generation error: {str(e)}")
+        logger.error("Voice generation error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/book', methods=['POST'])
-def book_appointment():
+async def book_appointment():
     """
     Book an appointment in GoHighLevel
     
@@ -122,75 +508,117 @@ def book_appointment():
     try:
         # Enhanced debugging
         logger.info("Book appointment request received")
-        logger.info(f"Request headers: {dict(request.headers)}")
+        logger.info("Request headers: %r", request.headers)
+        
+        data = await request.get_json()
+        logger.info("Request data: %s", data)
         
-        data = request.get_json()
-        logger.info(f"Request data: {json.dumps(data)}")
+        if not isinstance(data, dict):
+            logger.error("Invalid request: body is not a JSON object")
+            return jsonify({"error": "Request body must be a JSON object"}), 400
         
         # Validate required fields
-        required_fields = ['name', 'phone', 'email', 'selectedSlot']
-        logger.info(f"Validating required fields: {required_fields}")
-        
-        missing_fields = []
-        for field in required_fields:
-            if field not in data:
-                missing_fields.append(field)
-                
+        missing_fields = sorted(REQUIRED_BOOKING_FIELDS - data.keys())
+        
         if missing_fields:
-            logger.error(f"Invalid request: missing fields: {missing_fields}")
+            logger.error("Invalid request: missing fields: %s", missing_fields)
             return jsonify({"error": f"Missing required fields: {', '.join(missing_fields)}"}), 400
         
-        logger.info(f"Booking request received for {data['name']}")
+        logger.info("Booking request received for %s", data['name'])
         
-        # Default to Central Time (America/Chicago)
-        central = pytz_timezone("America/Chicago")
-        logger.info(f"Using timezone: America/Chicago")
+        logger.info("Using timezone: America/Chicago")
+        
+        # Add selectedTimezone to data if it doesn't exist (for GHL API compatibility)
+        if 'selectedTimezone' not in data:
+            data['selectedTimezone'] = 'America/Chicago'
+            logger.info("Added selectedTimezone=America/Chicago to request data for GHL compatibility")
+        
+        # Reject malformed slots up front; only well-shaped strings reach fromisoformat
+        if not isinstance(data['selectedSlot'], str) or not ISO_SLOT_RE.fullmatch(data['selectedSlot']):
+            logger.error("Invalid datetime format: %r", data['selectedSlot'])
+            return jsonify({"error": "Invalid datetime format: expected YYYY-MM-DDTHH:MM[:SS]"}), 400
         
         # Parse and localize the selectedSlot to Central Time
         try:
-            # Add selectedTimezone to data if it doesn't exist (for GHL API compatibility)
-            if 'selectedTimezone' not in data:
-                data['selectedTimezone'] = 'America/Chicago'
-                logger.info("Added selectedTimezone=America/Chicago to request data for GHL compatibility")
-            
-            appointment_time = central.localize(datetime.fromisoformat(data['selectedSlot']))
-            logger.info(f"Appointment time parsed and localized: {appointment_time.isoformat()}")
-        except Exception as e:
-            logger.error(f"Invalid datetime format: {str(e)}")
+            appointment_time = localize_central(datetime.fromisoformat(data['selectedSlot']))
+            logger.info("Appointment time parsed and localized: %s", appointment_time)
+        except ValueError as e:
+            logger.error("Invalid datetime format: %s", e)
             return jsonify({"error": f"Invalid datetime format: {str(e)}"}), 400
         
-        if not all([GHL_API_KEY, GHL_LOCATION_ID, GHL_CALENDAR_ID]):
-            logger.error("GoHighLevel API configuration incomplete")
-            return jsonify({"error": "GoHighLevel API configuration incomplete"}), 500
-        
-        # First, create or update contact in GoHighLevel
+        # First, find or create the contact in GoHighLevel
         contact_url = "https://rest.gohighlevel.com/v1/contacts/"
+        contact_lookup_url = "https://rest.gohighlevel.com/v1/contacts/lookup"
+        slots_url = "https://rest.gohighlevel.com/v1/appointments/slots"
         contact_headers = {
-            "Authorization": f"Bearer {GHL_API_KEY}",
+            "Authorization": f"Bearer {CFG.ghl_api_key}",
             "Content-Type": "application/json"
         }
+        name_parts = data['name'].split(' ', 1)
         contact_payload = {
             "email": data['email'],
             "phone": data['phone'],
-            "firstName": data['name'].split(' ')[0],
-            "lastName": " ".join(data['name'].split(' ')[1:]) if len(data['name'].split(' ')) > 1 else "",
-            "locationId": GHL_LOCATION_ID
+            "firstName": name_parts[0],
+            "lastName": name_parts[1] if len(name_parts) > 1 else "",
+            "locationId": CFG.ghl_location_id
         }
         
-        logger.info(f"Sending contact creation request to GHL: {json.dumps(contact_payload)}")
-        contact_response = requests.post(contact_url, json=contact_payload, headers=contact_headers)
+        # Look up an existing contact and check the slot is still free concurrently
+        day_start = datetime.combine(appointment_time.date(), time.min, tzinfo=CENTRAL)
+        slots_params = {
+            "calendarId": CFG.ghl_calendar_id,
+            "startDate": int(day_start.timestamp() * 1000),
+            "endDate": int((day_start + timedelta(days=1)).timestamp() * 1000) - 1,
+            "timezone": "America/Chicago"
+        }
         
-        if contact_response.status_code not in [200, 201]:
-            logger.error(f"GoHighLevel contact creation error: {contact_response.status_code} - {contact_response.text}")
-            return jsonify({
-                "error": "Failed to create contact",
-                "details": contact_response.text
-            }), 500
+        logger.info("Looking up GHL contact and free slots for %s", data['email'])
+        lookup_response, slots_response = await asyncio.gather(
+            get_with_retry(contact_lookup_url, params={"email": data['email']}, headers=contact_headers),
+            get_with_retry(slots_url, params=slots_params, headers=contact_headers)
+        )
+        
+        # The availability check is advisory: only a cleanly parsed slot list can reject the booking
+        slot_available = None
+        if slots_response.status_code == 200:
+            try:
+                day_slots = orjson.loads(slots_response.content)[appointment_time.date().isoformat()]['slots']
+                slot_available = any(parse_ghl_slot(slot).timestamp() == appointment_time.timestamp() for slot in day_slots)
+            except (ValueError, AttributeError, TypeError, KeyError) as e:
+                logger.warning("Could not verify slot availability: unexpected slots response: %r", e)
+        else:
+            logger.warning("Could not verify slot availability: %s - %s", slots_response.status_code, slots_response.text)
         
-        contact_data = contact_response.json()
-        logger.info(f"GHL contact response: {json.dumps(contact_data)}")
+        if slot_available is False:
+            logger.error("Selected slot is not available: %s", appointment_time)
+            return jsonify({"error": "Selected slot is not available"}), 409
         
-        contact_id = contact_data.get('id') or contact_data.get('contact', {}).get('id')
+        # The lookup only saves a create call, so an unexpected response falls through to creation
+        contact_id = None
+        if lookup_response.status_code == 200:
+            try:
+                contacts = orjson.loads(lookup_response.content).get('contacts', [])
+                if contacts:
+                    contact_id = contacts[0].get('id')
+                    logger.info("Found existing GHL contact: %s", contact_id)
+            except (ValueError, AttributeError, TypeError, KeyError) as e:
+                logger.warning("Could not read GHL contact lookup response, creating contact: %r", e)
+        
+        if not contact_id:
+            logger.info("Sending contact creation request to GHL: %s", contact_payload)
+            contact_response = await ghl_client.post(contact_url, content=orjson.dumps(contact_payload), headers=contact_headers)
+            
+            if contact_response.status_code not in [200, 201]:
+                logger.error("GoHighLevel contact creation error: %s - %s", contact_response.status_code, contact_response.text)
+                return jsonify({
+                    "error": "Failed to create contact",
+                    "details": contact_response.text
+                }), 500
+            
+            contact_data = orjson.loads(contact_response.content)
+            logger.info("GHL contact response: %s", contact_data)
+            
+            contact_id = contact_data.get('id') or contact_data.get('contact', {}).get('id')
         
         if not contact_id:
             logger.error("Failed to get contact ID from GoHighLevel response")
@@ -199,12 +627,12 @@ def book_appointment():
         # Now book the appointment
         calendar_url = f"https://rest.gohighlevel.com/v1/appointments/"
         calendar_payload = {
-            "calendarId": GHL_CALENDAR_ID,
+            "calendarId": CFG.ghl_calendar_id,
             "contactId": contact_id,
             "startTime": appointment_time.isoformat(),
             "title": f"Appointment with {data['name']}",
             "description": "Appointment booked via VAPPI Voice Bot",
-            "locationId": GHL_LOCATION_ID,
+            "locationId": CFG.ghl_location_id,
             # Add timezone explicitly for GHL API
             "timezone": "America/Chicago",
             # Add required GHL API fields
@@ -212,33 +640,31 @@ def book_appointment():
             "selectedSlot": data['selectedSlot']
         }
         
-        logger.info(f"Sending appointment creation request to GHL: {json.dumps(calendar_payload)}")
-        calendar_response = requests.post(calendar_url, json=calendar_payload, headers=contact_headers)
+        logger.info("Sending appointment creation request to GHL: %s", calendar_payload)
+        calendar_response = await ghl_client.post(calendar_url, content=orjson.dumps(calendar_payload), headers=contact_headers)
         
-        logger.info(f"GHL appointment response status: {calendar_response.status_code}")
-        logger.info(f"GHL appointment response: {calendar_response.text}")
+        logger.info("GHL appointment response status: %s", calendar_response.status_code)
+        logger.info("GHL appointment response: %s", calendar_response.text)
         
         if calendar_response.status_code in [200, 201]:
-            logger.info(f"Appointment successfully booked for {data['name']}")
+            logger.info("Appointment successfully booked for %s", data['name'])
             return jsonify({
                 "success": True,
                 "message": "Appointment booked successfully",
                 "scheduled_time": appointment_time.isoformat(),
-                "appointment": calendar_response.json()
+                "appointment": orjson.loads(calendar_response.content)
             })
         else:
-            logger.error(f"GoHighLevel appointment booking error: {calendar_response.status_code} - {calendar_response.text}")
+            logger.error("GoHighLevel appointment booking error: %s - %s", calendar_response.status_code, calendar_response.text)
             return jsonify({
                 "error": "Failed to book appointment",
                 "details": calendar_response.text
             }), 500
             
     except Exception as e:
-        logger.error(f"Appointment booking error: {str(e)}")
+        logger.error("Appointment booking error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
-    # Get port from environment variable or use default
-    port = int(os.getenv('PORT') or os.getenv('RAILWAY_PORT') or 5000)
-    logger.info(f"Starting VAPPI Voice Bot Backend on port {port}")
-    app.run(host='0.0.0.0', port=port)
+    logger.info("Starting VAPPI Voice Bot Backend on port %s", CFG.port)
+    uvicorn.run(app, host='0.0.0.0', port=CFG.port)